@@ -7,11 +7,18 @@ from pathlib import Path
 
 from menthol import Driver
 from menthol.__version__ import __VERSION__
+from menthol.export import FORMATS
+from menthol.cache import ArtifactCache
+from menthol.profiler import PROFILERS, parse_profile_spec
 from menthol.util import import_by_path, drivers_in_module
 
 logger = logging.getLogger(__name__)
 
 
+def split_or_none(s):
+    return s.split(",") if s else None
+
+
 def setup_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("-v", "--verbose", action="store_true",
@@ -28,11 +35,35 @@ def setup_parser():
 
     build = subparsers.add_parser("build")
     build.set_defaults(which="build")
+    build.add_argument("--artifact-cache", type=str,
+                       help="directory (local or shared) to cache build "
+                            "artifacts in")
+    build.add_argument("--cache-size", type=int,
+                       help="evict least recently used artifacts to keep "
+                            "the cache under this many bytes")
 
     run = subparsers.add_parser("run")
     run.set_defaults(which="run")
     run.add_argument("-i", "--invocation", type=int, default=20,
                      help="how many invocation")
+    run.add_argument("--max-attempts", type=int,
+                     help="how many times a failing job is run "
+                          "(standalone only)")
+    run.add_argument("--backoff", type=float,
+                     help="seconds to wait before the first retry, doubled "
+                          "for each further retry")
+    run.add_argument("--fail-fast", type=int,
+                     help="skip the rest of a benchmark/configuration pair "
+                          "after this many consecutive failed jobs")
+    run.add_argument("--profile", type=str,
+                     help="profile a sample of invocations, e.g. sample:0.1")
+    run.add_argument("--profiler", choices=sorted(PROFILERS), default="perf",
+                     help="sampling profiler used by --profile")
+    run.add_argument("--profile-benchmarks", type=str,
+                     help="only profile these benchmarks, separated by comma")
+    run.add_argument("--profile-configurations", type=str,
+                     help="only profile these configurations, separated by "
+                          "comma")
 
     clean = subparsers.add_parser("clean")
     clean.set_defaults(which="clean")
@@ -40,6 +71,26 @@ def setup_parser():
     analyse = subparsers.add_parser("analyse")
     analyse.set_defaults(which="analyse")
     analyse.add_argument("LOGDIR")
+    analyse.add_argument("--no-memoize", action="store_true",
+                         help="rerun every pipeline instead of reusing "
+                              "memoized outputs in LOGDIR/cache")
+    analyse.add_argument("--include-profiled", action="store_true",
+                         help="also analyse invocations run under a profiler")
+    analyse.add_argument("--processes", action="store_true",
+                         help="run independent pipelines in separate "
+                              "processes rather than threads")
+
+    export = subparsers.add_parser("export")
+    export.set_defaults(which="export")
+    export.add_argument("LOGDIR")
+    export.add_argument("-f", "--format", choices=FORMATS, default="parquet",
+                        help="output format")
+    export.add_argument("-o", "--output", type=str,
+                        help="output file, defaults to LOGDIR/results.FORMAT")
+    export.add_argument("--chunk-size", type=int, default=10000,
+                        help="rows per chunk (Parquet row group)")
+    export.add_argument("--include-profiled", action="store_true",
+                        help="also export invocations run under a profiler")
     return parser
 
 
@@ -72,14 +123,35 @@ def main():
         # Handle subcommands
         if args.get("which") == "run":
             driver.infrastructure.setup()
+            infra = driver.infrastructure
+            if any(args[k] is not None
+                   for k in ("max_attempts", "backoff", "fail_fast")):
+                infra.set_retry_policy(
+                    args["max_attempts"] or getattr(infra, "max_attempts", 1),
+                    args["backoff"] if args["backoff"] is not None
+                    else getattr(infra, "backoff", 0),
+                    args["fail_fast"] or getattr(infra, "fail_fast", None))
             driver.set_invocation(args["invocation"])
+            if args["profile"]:
+                driver.set_profiler(
+                    PROFILERS[args["profiler"]],
+                    parse_profile_spec(args["profile"]),
+                    split_or_none(args["profile_benchmarks"]),
+                    split_or_none(args["profile_configurations"]))
             driver.start()
         elif args.get("which") == "clean":
             driver.clean()
         elif args.get("which") == "build":
+            if args["artifact_cache"]:
+                driver.set_artifact_cache(ArtifactCache(
+                    args["artifact_cache"], args["cache_size"]))
             driver.build()
         elif args.get("which") == "analyse":
-            driver.analyse(args["LOGDIR"])
+            driver.analyse(args["LOGDIR"], not args["no_memoize"],
+                           args["include_profiled"], args["processes"])
+        elif args.get("which") == "export":
+            driver.export(args["LOGDIR"], args["format"], args["output"],
+                          args["chunk_size"], args["include_profiled"])
         else:
             parsers.print_help()
 
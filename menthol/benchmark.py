@@ -14,6 +14,19 @@ class Benchmark(object):
     def build(self, configuration):
         raise NotImplementedError
 
+    def artifacts(self, configuration):
+        """Paths of the files or directories build produces for
+        configuration. Only benchmarks that declare artifacts (and a
+        source_tree) can use the artifact cache.
+        """
+        return []
+
+    def source_tree(self, configuration):
+        """Path of the sources build compiles for configuration, hashed to
+        tell apart builds of different revisions.
+        """
+        return None
+
     def realize_job(self, job, configuration, invocation):
         job.set_metadata({
             "benchmark": self.name,
@@ -22,4 +35,19 @@ class Benchmark(object):
         })
 
     def clean(self, configuration):
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def parse(self, stdout, stderr):
+        """Extract the stats of one invocation from its whole stdout and
+        stderr.
+        """
+        raise NotImplementedError
+
+    def parse_stream(self, stdout, stderr):
+        """Extract the stats of one invocation from iterators over the lines
+        of its stdout and stderr (for example, open log files).
+
+        Override this to parse huge logs in constant memory. By default, the
+        lines are joined and handed to parse.
+        """
+        return self.parse("".join(stdout), "".join(stderr))
\ No newline at end of file
@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+import logging
+
+from menthol.util import mkdirp, stable_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def _size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, filenames in os.walk(path):
+        for f in filenames:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+class ArtifactCache(object):
+    """A content-addressed store of build artifacts.
+
+    Entries live in `root` (which can be shared between hosts, for example
+    over NFS) and are keyed by the benchmark, the configuration args and a
+    hash of the source tree. Entries are published by an atomic rename, so
+    concurrent builders never see half-written entries. When `max_size` (in
+    bytes) is set, the least recently used entries are evicted to stay below
+    it.
+
+    With `link` set, artifacts are hardlinked out of the cache on a hit
+    (falling back to copying across filesystems). Call detach before
+    rebuilding them, so builds that modify artifacts in place don't corrupt
+    the cache.
+    """
+
+    def __init__(self, root, max_size=None, link=True):
+        self.root = root
+        self.max_size = max_size
+        self.link = link
+        mkdirp(root)
+
+    def key(self, benchmark_name, args, source_hash):
+        return stable_hash(benchmark_name, args, source_hash)
+
+    def entry(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key, paths):
+        """Place the artifacts cached under key at paths. Returns whether
+        there was a hit.
+        """
+        entry = self.entry(key)
+        if not os.path.isdir(entry):
+            return False
+        copy = _link_or_copy if self.link else shutil.copy2
+        placed = []
+        try:
+            for i, path in enumerate(paths):
+                src = os.path.join(entry, str(i))
+                _remove(path)
+                mkdirp(os.path.dirname(os.path.abspath(path)))
+                placed.append(path)
+                if os.path.isdir(src):
+                    shutil.copytree(src, path, symlinks=True,
+                                    copy_function=copy)
+                else:
+                    copy(src, path)
+            # mark as recently used
+            os.utime(entry)
+        except (OSError, shutil.Error) as e:
+            # most likely evicted by another host while we were copying
+            logger.warning("Failed to fetch {} from artifact cache: {}".format(
+                entry, e))
+            for path in placed:
+                _remove(path)
+            return False
+        logger.info("Fetched {} from artifact cache {}".format(paths, entry))
+        return True
+
+    def detach(self, paths):
+        """Replace hardlinked files under paths by private copies."""
+        for path in paths:
+            if os.path.isdir(path):
+                files = [os.path.join(root, f)
+                         for root, _, filenames in os.walk(path)
+                         for f in filenames]
+            else:
+                files = [path]
+            for f in files:
+                if not os.path.islink(f) and os.path.isfile(f) and \
+                        os.stat(f).st_nlink > 1:
+                    tmp = f + ".menthol-detach"
+                    shutil.copy2(f, tmp)
+                    os.replace(tmp, f)
+
+    def store(self, key, paths):
+        """Copy the artifacts at paths into the cache under key."""
+        missing = [p for p in paths if not os.path.exists(p)]
+        if missing:
+            logger.warning("Not caching {}, missing artifacts {}".format(
+                key, missing))
+            return
+        entry = self.entry(key)
+        mkdirp(os.path.dirname(entry))
+        mkdirp(os.path.join(self.root, "tmp"))
+        tmp = tempfile.mkdtemp(dir=os.path.join(self.root, "tmp"))
+        try:
+            for i, path in enumerate(paths):
+                dst = os.path.join(tmp, str(i))
+                if os.path.isdir(path):
+                    shutil.copytree(path, dst, symlinks=True)
+                else:
+                    shutil.copy2(path, dst)
+            os.rename(tmp, entry)
+        except OSError:
+            # someone else published the same entry first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(entry):
+                raise
+        logger.info("Stored {} in artifact cache {}".format(paths, entry))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in
+        max_size. Entries are first renamed out of place, so a concurrent
+        fetch either sees the whole entry or none of it.
+        """
+        if self.max_size is None:
+            return
+        entries = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix == "tmp" or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    entries.append(
+                        (os.path.getmtime(entry), _size(entry), entry))
+                except FileNotFoundError:
+                    # evicted concurrently
+                    continue
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            logger.info("Evicting {} from artifact cache".format(entry))
+            total -= size
+            mkdirp(os.path.join(self.root, "tmp"))
+            doomed = tempfile.mkdtemp(dir=os.path.join(self.root, "tmp"))
+            try:
+                os.rename(entry, os.path.join(doomed, "entry"))
+            except FileNotFoundError:
+                # evicted concurrently
+                pass
+            shutil.rmtree(doomed, ignore_errors=True)
@@ -0,0 +1,145 @@
+import gzip
+import io
+import os
+import subprocess
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TRUNCATION_MARKER = "\n[menthol: {} bytes truncated]\n"
+
+
+class OutputCapture(object):
+    """A file-like sink for the output of a job.
+
+    Output is streamed to `filename` as it arrives, so a chatty job never
+    needs to fit in memory. When `limit` is set, at most `limit` bytes are
+    kept: the first `head` bytes (by default, half of the limit) and the last
+    `limit - head` bytes, separated by a marker line recording how much was
+    dropped. When `compress` is set, the output is gzipped on the fly and
+    ".gz" is appended to `filename`.
+    """
+
+    def __init__(self, filename, limit=None, head=None, compress=False):
+        if limit is not None and head is None:
+            head = limit // 2
+        if limit is not None and not 0 <= head <= limit:
+            raise ValueError("head must be between 0 and limit")
+        self.limit = limit
+        self.head = head
+        self.compress = compress
+        self.filename = filename + ".gz" if compress else filename
+        self.written = 0
+        self.tail = bytearray()
+        if compress:
+            self.file = gzip.open(self.filename, "wb")
+        else:
+            self.file = open(self.filename, "wb")
+
+    @property
+    def truncated(self):
+        if self.limit is None:
+            return 0
+        return max(0, self.written - self.limit)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        start = self.written
+        self.written += len(data)
+        if self.limit is None:
+            self.file.write(data)
+            return len(data)
+        if start < self.head:
+            head_len = min(len(data), self.head - start)
+            self.file.write(data[:head_len])
+            data = data[head_len:]
+        tail_limit = self.limit - self.head
+        if tail_limit > 0 and data:
+            self.tail.extend(data[-tail_limit:])
+            del self.tail[:-tail_limit]
+        return self.written - start
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.truncated:
+            logger.warning("Output {} exceeded {} bytes, {} bytes truncated"
+                           .format(self.filename, self.limit, self.truncated))
+            self.file.write(
+                TRUNCATION_MARKER.format(self.truncated).encode("utf-8"))
+        self.file.write(bytes(self.tail))
+        self.tail = bytearray()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _pump(src, sink, errors):
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+        if errors:
+            # keep draining, or the process blocks on a full pipe
+            continue
+        try:
+            sink.write(chunk)
+        except Exception as e:
+            logger.error("Failed to capture output: {}".format(e))
+            errors.append(e)
+    src.close()
+
+
+def wait_rusage(proc):
+    """Wait for proc and return its exit status along with the resource usage
+    of proc and the descendants it waited for (not of any other child).
+    """
+    _, status, rusage = os.wait4(proc.pid, 0)
+    if os.WIFSIGNALED(status):
+        proc.returncode = -os.WTERMSIG(status)
+    else:
+        proc.returncode = os.WEXITSTATUS(status)
+    return proc.returncode, rusage
+
+
+def run_captured(args, stdout, stderr, **kwargs):
+    """Like subprocess.run, but stream stdout and stderr into the given sinks
+    chunk by chunk instead of buffering them. Returns the exit status and the
+    resource usage of the process.
+
+    If writing to a sink fails (e.g. the disk is full), the rest of the
+    output is discarded so the process can run to completion, and the error
+    is raised once it has exited.
+    """
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, **kwargs)
+    errors = []
+    pumps = [
+        threading.Thread(target=_pump, args=(proc.stdout, stdout, errors)),
+        threading.Thread(target=_pump, args=(proc.stderr, stderr, errors))
+    ]
+    for t in pumps:
+        t.start()
+    for t in pumps:
+        t.join()
+    result = wait_rusage(proc)
+    if errors:
+        raise errors[0]
+    return result
+
+
+def open_log(filename):
+    """Open a captured log for reading as text, transparently handling logs
+    that were compressed by OutputCapture.
+    """
+    if not os.path.exists(filename) and os.path.exists(filename + ".gz"):
+        return io.TextIOWrapper(gzip.open(filename + ".gz", "rb"),
+                                encoding="utf-8", errors="replace")
+    return open(filename, encoding="utf-8", errors="replace")
@@ -4,11 +4,13 @@ import subprocess
 import os
 import json
 from collections import defaultdict
-from functools import reduce
-from copy import deepcopy
 
 from menthol.infrastructure import Standalone
-from menthol.util import frozen_dict
+from menthol.util import frozen_dict, hash_tree
+from menthol.capture import open_log
+from menthol.export import exporter, metric_rows
+from menthol.pipeline import run_pipelines
+from menthol.profiler import sampled
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,28 @@ class Driver(object):
         for pipeline in self.pipelines:
             pipeline.bind_driver(self)
 
+    def set_profiler(self, profiler, rate, benchmarks=None,
+                     configurations=None):
+        """Profile a rate fraction of the invocations of the given benchmarks
+        and configurations (all of them by default) with profiler.
+        """
+        self.profiler = profiler
+        self.profile_rate = rate
+        self.profile_benchmarks = benchmarks
+        self.profile_configurations = configurations
+        logger.info("Profiling {} of invocations with {}".format(
+            rate, profiler.name))
+
+    def should_profile(self, bm, config, invocation):
+        if not getattr(self, "profiler", None):
+            return False
+        if self.profile_benchmarks and bm.name not in self.profile_benchmarks:
+            return False
+        if self.profile_configurations and \
+                config.descr not in self.profile_configurations:
+            return False
+        return sampled(invocation, self.profile_rate)
+
     def set_invocation(self, invocation):
         self.invocation = invocation
         logger.info("Set invocation to {}".format(self.invocation))
@@ -54,45 +78,148 @@ class Driver(object):
             for configuration in self.configurations:
                 benchmark.clean(configuration)
 
+    def set_artifact_cache(self, artifact_cache):
+        self.artifact_cache = artifact_cache
+
     def build(self):
+        source_hashes = {}
         for benchmark in self.benchmarks:
             for configuration in self.configurations:
-                benchmark.build(configuration)
+                self.build_one(benchmark, configuration, source_hashes)
+
+    def source_hash(self, source_tree):
+        """Hash source_tree, leaving out the artifacts that any benchmark
+        builds inside it, so leftover build outputs don't change the hash.
+        """
+        source_tree = os.path.abspath(source_tree)
+        artifacts = [
+            a
+            for benchmark in self.benchmarks
+            for configuration in self.configurations
+            if benchmark.source_tree(configuration) and os.path.abspath(
+                benchmark.source_tree(configuration)) == source_tree
+            for a in benchmark.artifacts(configuration)
+        ]
+        return hash_tree(source_tree, exclude=artifacts)
 
-    def analyse(self, logdir):
+    def build_one(self, benchmark, configuration, source_hashes=None):
+        """Build benchmark for configuration, going through the artifact
+        cache if there is one. source_hashes memoizes the hash of each source
+        tree, so that a tree shared by several builds is hashed once.
+        """
+        cache = getattr(self, "artifact_cache", None)
+        artifacts = benchmark.artifacts(configuration)
+        source_tree = benchmark.source_tree(configuration)
+        if not cache or not artifacts or not source_tree:
+            benchmark.build(configuration)
+            return
+        if source_hashes is None:
+            source_hashes = {}
+        source_tree = os.path.abspath(source_tree)
+        if source_tree not in source_hashes:
+            source_hashes[source_tree] = self.source_hash(source_tree)
+        key = cache.key(benchmark.name, configuration.args,
+                        source_hashes[source_tree])
+        if cache.fetch(key, artifacts):
+            return
+        cache.detach(artifacts)
+        benchmark.build(configuration)
+        cache.store(key, artifacts)
+
+    def analyse(self, logdir, memoize=True, include_profiled=False,
+                processes=False):
+        cache_dir = os.path.join(logdir, "cache") if memoize else None
         logs = defaultdict(lambda: defaultdict(lambda: defaultdict(list)))
         bm_names = [b.name for b in self.benchmarks]
         config_descrs = [c.descr for c in self.configurations]
-        with open(os.path.join(logdir, "MANIFEST")) as manifest_file:
-            for line in manifest_file:
-                cols = line.split("\t")
-                uuid = cols[0]
-                metadata = json.loads(cols[3])
-                with open(os.path.join(logdir,"{}.o".format(uuid))) as stdout_file:
-                    stdout = stdout_file.read()
-                with open(os.path.join(logdir,"{}.e".format(uuid))) as stderr_file:
-                    stderr = stderr_file.read()
-                bm = metadata["benchmark"]
-                config = metadata["configuration"]
-                if bm in bm_names and config in config_descrs:
-                    driver_args = frozen_dict(metadata["driver_args"])
-                    logs[bm][config][driver_args].append({
-                        "stdout": stdout,
-                        "stderr": stderr
-                    })
+        for uuid, metadata, status in self.read_manifest(logdir):
+            if status.get("status", "ok") != "ok":
+                logger.info("Excluding {} job {}".format(
+                    status["status"], uuid))
+                continue
+            if metadata.get("profiler") and not include_profiled:
+                logger.info("Excluding profiled job {}".format(uuid))
+                continue
+            bm = metadata["benchmark"]
+            config = metadata["configuration"]
+            if bm in bm_names and config in config_descrs:
+                driver_args = frozen_dict(metadata["driver_args"])
+                logs[bm][config][driver_args].append({
+                    "stdout": os.path.join(logdir, "{}.o".format(uuid)),
+                    "stderr": os.path.join(logdir, "{}.e".format(uuid))
+                })
         for bm in self.benchmarks:
-            bm_result = deepcopy(logs[bm.name])
-            for config in bm_result:
-                for driver_args in bm_result[config]:
-                    bm_result[config][driver_args] = [
-                        bm.parse(log["stdout"], log["stderr"])
-                        for log in bm_result[config][driver_args]
+            # plain dicts, as stage inputs and outputs get pickled
+            bm_result = {
+                config: {
+                    driver_args: [
+                        self.parse_log(bm, log["stdout"], log["stderr"])
+                        for log in config_logs[driver_args]
                     ]
-                        
-            pipelines = bm.pipelines
-            reduce(lambda x, y: y.process(bm, x),
-                   pipelines,
-                   bm_result)
+                    for driver_args in config_logs
+                }
+                for config, config_logs in logs[bm.name].items()
+            }
+            for pipeline in bm.pipelines:
+                pipeline.bind_logdir(logdir)
+            run_pipelines(bm, bm.pipelines, bm_result, cache_dir,
+                          processes=processes)
+
+    def read_manifest(self, logdir):
+        """Yield (uuid, metadata, status) for each job in the MANIFEST of
+        logdir. status is empty for jobs recorded without one.
+        """
+        with open(os.path.join(logdir, "MANIFEST")) as manifest_file:
+            for line in manifest_file:
+                cols = line.rstrip("\n").split("\t")
+                status = json.loads(cols[4]) if len(cols) > 4 else {}
+                yield cols[0], json.loads(cols[3]), status
+
+    def export(self, logdir, fmt, filename=None, chunk_size=10000,
+               include_profiled=False):
+        """Parse every log in logdir once and write the per-invocation stats,
+        along with the metadata and resource usage of the job, in one row per
+        metric. Rows are grouped by benchmark. Profiled jobs are left out
+        unless include_profiled is set.
+        """
+        if not filename:
+            filename = os.path.join(logdir, "results.{}".format(fmt))
+        jobs = defaultdict(list)
+        config_descrs = [c.descr for c in self.configurations]
+        for uuid, metadata, status in self.read_manifest(logdir):
+            if status.get("status", "ok") != "ok":
+                continue
+            if metadata.get("profiler") and not include_profiled:
+                continue
+            if metadata["configuration"] in config_descrs:
+                jobs[metadata["benchmark"]].append((uuid, metadata, status))
+        with exporter(fmt, filename, chunk_size) as e:
+            for bm in self.benchmarks:
+                for uuid, metadata, status in jobs[bm.name]:
+                    stats = self.parse_log(
+                        bm,
+                        os.path.join(logdir, "{}.o".format(uuid)),
+                        os.path.join(logdir, "{}.e".format(uuid)))
+                    e.write(metric_rows(
+                        stats,
+                        uuid=uuid,
+                        benchmark=bm.name,
+                        configuration=metadata["configuration"],
+                        driver_args=metadata.get("driver_args", {}),
+                        invocation=metadata.get("invocation"),
+                        profiled=bool(metadata.get("profiler")),
+                        returncode=status.get("returncode"),
+                        wall_time=status.get("wall_time"),
+                        utime=status.get("utime"),
+                        stime=status.get("stime"),
+                        maxrss=status.get("maxrss")
+                    ))
+        return filename
+
+    def parse_log(self, bm, stdout_filename, stderr_filename):
+        with open_log(stdout_filename) as stdout_file:
+            with open_log(stderr_filename) as stderr_file:
+                return bm.parse_stream(stdout_file, stderr_file)
 
     def start(self):
         if not getattr(self, "invocation"):
@@ -113,6 +240,12 @@ class Driver(object):
                 for i in range(0, self.invocation):
                     j = self.infrastructure.job_class()
                     bm.realize_job(j, config, i)
+                    if self.should_profile(bm, config, i):
+                        # profiled runs are slowed down, so tag them for
+                        # analyse and export to leave out
+                        j.set_metadata({"profiler": self.profiler.name})
+                        j.set_profiler(self.profiler, os.path.join(
+                            self.infrastructure.basedir, j.stacks_filename))
                     jobs.append(j)
         return jobs
 
@@ -0,0 +1,152 @@
+import csv
+import json
+import logging
+import numbers
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "uuid",
+    "benchmark",
+    "configuration",
+    "driver_args",
+    "invocation",
+    "index",
+    "profiled",
+    "returncode",
+    "wall_time",
+    "utime",
+    "stime",
+    "maxrss",
+    "metric",
+    "value"
+]
+
+FORMATS = ["parquet", "csv"]
+
+
+def metric_rows(stats, **columns):
+    """Flatten the stats returned by Benchmark.parse into one row per metric.
+
+    Stats can be a single number (exported as metric "value") or a dict from
+    metric names to numbers. Anything that is not a number is skipped.
+    """
+    if not isinstance(stats, dict):
+        stats = {"value": stats}
+    for metric, value in sorted(stats.items()):
+        if isinstance(value, bool) or not isinstance(value, numbers.Real):
+            logger.debug("Skipping non-numeric metric {}={!r}".format(
+                metric, value))
+            continue
+        row = dict.fromkeys(COLUMNS)
+        row.update(columns)
+        if isinstance(row["driver_args"], (dict, frozenset)):
+            row["driver_args"] = json.dumps(dict(row["driver_args"]),
+                                            sort_keys=True)
+        row["metric"] = str(metric)
+        row["value"] = float(value)
+        yield row
+
+
+class Exporter(object):
+    """Write rows in chunks of `chunk_size`.
+
+    A chunk never spans two benchmarks, so each chunk (a row group for
+    Parquet) only holds rows of a single benchmark, and downstream tools can
+    skip the benchmarks they don't need.
+    """
+
+    def __init__(self, filename, chunk_size=10000):
+        self.filename = filename
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.rows = 0
+
+    def write(self, rows):
+        for row in rows:
+            if self.chunk and \
+                    self.chunk[-1]["benchmark"] != row["benchmark"]:
+                self.flush()
+            self.chunk.append(row)
+            if len(self.chunk) >= self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.write_chunk(self.chunk)
+            self.rows += len(self.chunk)
+            self.chunk = []
+
+    def write_chunk(self, chunk):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+        logger.info("Exported {} rows to {}".format(self.rows, self.filename))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVExporter(Exporter):
+    def __init__(self, filename, chunk_size=10000):
+        super().__init__(filename, chunk_size)
+        self.file = open(filename, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=COLUMNS)
+        self.writer.writeheader()
+
+    def write_chunk(self, chunk):
+        self.writer.writerows(chunk)
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class ParquetExporter(Exporter):
+    def __init__(self, filename, chunk_size=10000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError(
+                "Parquet export requires pyarrow, "
+                "install menthol[parquet] or pick another format")
+        super().__init__(filename, chunk_size)
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+            ("uuid", pyarrow.string()),
+            ("benchmark", pyarrow.string()),
+            ("configuration", pyarrow.string()),
+            ("driver_args", pyarrow.string()),
+            ("invocation", pyarrow.int64()),
+            ("index", pyarrow.int64()),
+            ("profiled", pyarrow.bool_()),
+            ("returncode", pyarrow.int64()),
+            ("wall_time", pyarrow.float64()),
+            ("utime", pyarrow.float64()),
+            ("stime", pyarrow.float64()),
+            ("maxrss", pyarrow.int64()),
+            ("metric", pyarrow.string()),
+            ("value", pyarrow.float64())
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(filename, self.schema)
+
+    def write_chunk(self, chunk):
+        table = self.pa.Table.from_pylist(chunk, schema=self.schema)
+        self.writer.write_table(table, row_group_size=len(chunk))
+
+    def close(self):
+        super().close()
+        self.writer.close()
+
+
+def exporter(fmt, filename, chunk_size=10000):
+    if fmt == "parquet":
+        return ParquetExporter(filename, chunk_size)
+    elif fmt == "csv":
+        return CSVExporter(filename, chunk_size)
+    raise ValueError("Unknown export format {}".format(fmt))
@@ -6,9 +6,12 @@ import socket
 import pathlib
 import logging
 import json
+import time
+from collections import defaultdict
 
 from menthol.job import BashJob, PBSJob
 from menthol.util import mkdirp, subprocess_run
+from menthol.capture import OutputCapture
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +25,10 @@ class Infrastructure(object):
         else:
             self.name = name
 
+    def set_retry_policy(self, max_attempts=1, backoff=0, fail_fast=None):
+        logger.warning("{} does not support retry policies, ignoring".format(
+            type(self).__name__))
+
     def setup(self):
         raise NotImplementedError
 
@@ -33,11 +40,35 @@ class Infrastructure(object):
 
 
 class Standalone(Infrastructure):
-    def __init__(self, name=None, basedir=None):
+    def __init__(self, name=None, basedir=None, output_limit=None,
+                 output_head=None, compress=False):
+        """output_limit caps how many bytes of stdout/stderr are kept per job
+        (jobs can override it with Job.set_output_limit), keeping the first
+        output_head bytes and the tail. compress gzips the logs as they are
+        written.
+        """
         super().__init__(name)
         self.job_class = BashJob
         self.basedir = basedir if basedir else os.path.join(
             os.getcwd(), "results", self.name)
+        self.output_limit = output_limit
+        self.output_head = output_head
+        self.compress = compress
+        self.max_attempts = 1
+        self.backoff = 0
+        self.fail_fast = None
+
+    def set_retry_policy(self, max_attempts=1, backoff=0, fail_fast=None):
+        """Run a failing job (non-zero exit status) up to max_attempts times,
+        sleeping backoff * 2^(n-1) seconds before the n-th retry.
+
+        When fail_fast is set, once that many jobs of the same (benchmark,
+        configuration) in a row have failed all their attempts, the remaining
+        jobs of that pair are skipped.
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff
+        self.fail_fast = fail_fast
 
     def setup(self):
         mkdirp(self.basedir)
@@ -51,33 +82,88 @@ class Standalone(Infrastructure):
             x.metadata["invocation"],
             x.metadata["configuration"]
         ))
+
+    def capture(self, job, filename):
+        if job.output_limit is not None:
+            limit, head = job.output_limit, job.output_head
+        else:
+            limit, head = self.output_limit, self.output_head
+        return OutputCapture(
+            os.path.join(self.basedir, filename),
+            limit=limit,
+            head=head,
+            compress=self.compress
+        )
+
+    def run_job(self, job):
+        """Run job, retrying it according to the retry policy, and return its
+        status and the resource usage of the last attempt.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                delay = self.backoff * 2 ** (attempt - 2)
+                logger.info("Retrying job {} (attempt {}/{}) in {}s".format(
+                    job.id, attempt, self.max_attempts, delay))
+                time.sleep(delay)
+            start = time.monotonic()
+            error = None
+            try:
+                with self.capture(job, job.stdout_filename) as stdout_file:
+                    with self.capture(job, job.stderr_filename) as stderr_file:
+                        returncode = job.run(
+                            stdout=stdout_file,
+                            stderr=stderr_file
+                        )
+            except Exception as e:
+                # e.g. the disk filled up while capturing the output
+                logger.error("Job {} failed: {}".format(job.id, e))
+                error = str(e)
+            if error is None and returncode == 0:
+                break
+        status = {
+            "status": "ok" if error is None and returncode == 0 else "failed",
+            "returncode": job.returncode,
+            "attempts": attempt,
+            "wall_time": time.monotonic() - start
+        }
+        if error is not None:
+            status["error"] = error
+        if job.rusage is not None:
+            status.update({
+                "utime": job.rusage.ru_utime,
+                "stime": job.rusage.ru_stime,
+                "maxrss": job.rusage.ru_maxrss
+            })
+        return status
+
+    def run(self):
+        """Run the scheduled jobs one by one. Each job is recorded in the
+        MANIFEST once it finishes (or is skipped), with a fifth column holding
+        its status and resource usage.
+        """
         manifest_filename = os.path.join(self.basedir, "MANIFEST")
-        with open(manifest_filename, "a") as manifest_file:
-            for j in jobs:
-                manifest_file.write("{}\t{}\t{}\t{}\n".format(
+        consecutive_failures = defaultdict(int)
+        for j in self.jobs:
+            cell = (j.metadata["benchmark"], j.metadata["configuration"])
+            if self.fail_fast and consecutive_failures[cell] >= self.fail_fast:
+                logger.warning("Skipping job {}, {} failed {} times in a row"
+                               .format(j.id, cell, consecutive_failures[cell]))
+                status = {"status": "skipped", "attempts": 0}
+            else:
+                status = self.run_job(j)
+                if status["status"] == "failed":
+                    consecutive_failures[cell] += 1
+                else:
+                    consecutive_failures[cell] = 0
+            with open(manifest_filename, "a") as manifest_file:
+                manifest_file.write("{}\t{}\t{}\t{}\t{}\n".format(
                     j.id,
                     json.dumps(j.env),
                     json.dumps(j.cmds),
-                    json.dumps(j.metadata)
+                    json.dumps(j.metadata),
+                    json.dumps(status)
                 ))
 
-    def run(self):
-        for j in self.jobs:
-            stdout_filename = os.path.join(
-                self.basedir,
-                j.stdout_filename
-            )
-            stderr_filename = os.path.join(
-                self.basedir,
-                j.stderr_filename
-            )
-            with open(stdout_filename, "w") as stdout_file:
-                with open(stderr_filename, "w") as stderr_file:
-                    j.run(
-                        stdout=stdout_file,
-                        stderr=stderr_file
-                    )
-
 
 class Raijin(Infrastructure):
     def __init__(self, name=None, basedir=None):
@@ -1,9 +1,11 @@
 import uuid
+import shlex
 import tempfile
 import subprocess
 import logging
 
 from menthol.util import shorten_uuid
+from menthol.capture import OutputCapture, run_captured, wait_rusage
 
 logger = logging.getLogger(__name__)
 
@@ -15,10 +17,15 @@ class Job(object):
         self.cmds = []
         self.env = {}
         self.finished = False
+        self.returncode = None
+        self.rusage = None
         self.short_id = shorten_uuid(self.id)
         self.stdout_filename = "{}.o".format(self.id)
         self.stderr_filename = "{}.e".format(self.id)
+        self.stacks_filename = "{}.stacks".format(self.id)
         self.metadata = {}
+        self.output_limit = None
+        self.output_head = None
 
     def add_cmd(self, cmd, **kwargs):
         self.cmds.append((cmd, kwargs))
@@ -29,6 +36,14 @@ class Job(object):
     def set_metadata(self, metadata):
         self.metadata.update(metadata)
 
+    def set_output_limit(self, limit, head=None):
+        """Cap how many bytes of stdout and stderr are kept for this job.
+        The first `head` bytes and the remaining tail are retained, overriding
+        the infrastructure-wide default.
+        """
+        self.output_limit = limit
+        self.output_head = head
+
     def __str__(self):
         return "{}({})\nenv: {}\ncmds: {}\nmetadata: {}".format(
             self.name,
@@ -42,6 +57,15 @@ class Job(object):
 class BashJob(Job):
     def __init__(self):
         super().__init__()
+        self.profiler = None
+        self.stacks = None
+
+    def set_profiler(self, profiler, stacks):
+        """Run every command under profiler, appending the collapsed stacks
+        to the file stacks.
+        """
+        self.profiler = profiler
+        self.stacks = stacks
 
     def generate_script(self):
         lines = [
@@ -49,26 +73,52 @@ class BashJob(Job):
         ]
         for k, v in self.env.items():
             lines.append("export {}={}".format(k, v))
+        if self.profiler:
+            # start afresh if the job is retried
+            lines.append(": > {}".format(shlex.quote(self.stacks)))
         for cmd, kwargs in self.cmds:
             cmdline = []
             if "env" in kwargs:
                 for k, v in kwargs["env"].items():
                     cmdline.append("{}={}".format(k, v))
+            if self.profiler:
+                raw = "{}.raw".format(self.stacks)
+                cmd, collapse = self.profiler.wrap(cmd, raw)
             cmdline.extend(cmd)
             lines.append(" ".join(cmdline))
+            if self.profiler:
+                # keep the exit status of the command, not of the profiler
+                lines.append("menthol_status=$?")
+                lines.append("{} >> {}; rm -f {}".format(
+                    collapse, shlex.quote(self.stacks), shlex.quote(raw)))
+        if self.profiler and self.cmds:
+            lines.append("exit $menthol_status")
         lines.append("")
         return lines
 
     def run(self, **kwargs):
         logger.info("Running job: {}".format(self))
+        self.returncode = None
+        self.rusage = None
         script = tempfile.NamedTemporaryFile(buffering=0)
         script.write(
             "\n".join(self.generate_script()).encode("utf-8"))
-        subprocess.run(
-            ["bash", script.name],
-            **kwargs
-        )
-        script.close()
+        try:
+            if isinstance(kwargs.get("stdout"), OutputCapture):
+                self.returncode, self.rusage = run_captured(
+                    ["bash", script.name], **kwargs)
+            else:
+                self.returncode, self.rusage = wait_rusage(subprocess.Popen(
+                    ["bash", script.name],
+                    **kwargs
+                ))
+        finally:
+            script.close()
+        self.finished = True
+        if self.returncode != 0:
+            logger.warning("Job {} exited with status {}".format(
+                self.id, self.returncode))
+        return self.returncode
 
 
 class PBSJob(BashJob):
@@ -1,14 +1,45 @@
+import os
+import inspect
 import logging
+import pickle
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    wait, FIRST_COMPLETED
+
+from menthol.export import exporter, metric_rows
+from menthol.util import mkdirp, stable_hash
 
 logger = logging.getLogger(__name__)
 
 class Pipeline:
-    def __init__(self, name):
+    def __init__(self, name, depends=None, version=0, memoize=False):
+        """depends names the stages whose output this stage consumes. By
+        default a stage consumes the output of the stage before it (or the
+        parsed results, for the first stage); an empty list makes it consume
+        the parsed results. A stage with several dependencies receives a dict
+        from their names to their outputs.
+
+        With memoize set, the output is memoized on disk, keyed by the
+        inputs, the source of the stage's class (and its Pipeline bases),
+        version, and the stage's attributes (except driver, logdir and those
+        starting with an underscore). Bump version when process changes in a
+        way the key can't see, e.g. in a helper it calls. Leave memoize unset
+        for stages that matter for their side effects, such as plotting, so
+        they run on every analyse.
+        """
         self.name = name
+        self.depends = depends
+        self.version = version
+        self.memoize = memoize
 
     def bind_driver(self, driver):
         self.driver = driver
 
+    def bind_logdir(self, logdir):
+        """Called by Driver.analyse with the log directory being analysed."""
+        self.logdir = logdir
+
     def process(self, benchmark, results):
         """
         results: {config_name -> {driver_args -> [log](len: invocatio)}
@@ -22,4 +53,234 @@ class Pipeline:
         }
         """
         logger.info("Feeding through pipeline {}".format(self.name))
-        return results
\ No newline at end of file
+        return results
+
+
+def _load(filename):
+    try:
+        with open(filename, "rb") as f:
+            return True, pickle.load(f)
+    except FileNotFoundError:
+        return False, None
+    except Exception as e:
+        logger.warning("Ignoring corrupted cache {}: {}".format(filename, e))
+        return False, None
+
+
+def _store(filename, output):
+    cache_dir = os.path.dirname(filename)
+    mkdirp(cache_dir)
+    fd, tmp_filename = tempfile.mkstemp(dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(output, f)
+        os.replace(tmp_filename, filename)
+    except Exception as e:
+        os.unlink(tmp_filename)
+        logger.warning("Failed to memoize {}: {}".format(filename, e))
+
+
+def _identity(stage):
+    """What a stage's memo key covers besides its inputs: its code and its
+    attributes.
+    """
+    sources = []
+    for cls in type(stage).__mro__:
+        if issubclass(cls, Pipeline):
+            try:
+                sources.append(inspect.getsource(cls))
+            except (OSError, TypeError):
+                sources.append("{}.{}".format(cls.__module__, cls.__qualname__))
+    attrs = {}
+    for k, v in vars(stage).items():
+        if k in ("driver", "logdir") or k.startswith("_"):
+            continue
+        try:
+            attrs[k] = stable_hash(v)
+        except TypeError:
+            logger.debug("Leaving {}.{} out of the memo key".format(
+                stage.name, k))
+    return sources, attrs
+
+
+def _process(stage, benchmark, inputs):
+    return stage.process(benchmark, inputs)
+
+
+def run_pipelines(benchmark, pipelines, results, cache_dir=None,
+                  max_workers=None, processes=False):
+    """Feed results through the DAG formed by pipelines, running stages
+    whose dependencies are satisfied in parallel. Stages must not mutate
+    their inputs, which may be shared with other branches.
+
+    By default stages run on a thread pool, so branches only overlap where
+    they release the GIL (I/O, most numpy). With processes set, they run on a
+    process pool instead, which suits CPU-bound stages (e.g. bootstrapping)
+    and stages using non-thread-safe libraries (e.g. pyplot). Stages,
+    benchmark and every output must then be picklable, and changes a stage
+    makes to its own attributes are lost.
+
+    When cache_dir is set, memoized stages reuse the output of a previous run
+    with the same name, version and inputs. Returns {stage name -> output}.
+    """
+    depends = {}
+    for i, stage in enumerate(pipelines):
+        if stage.name in depends:
+            raise ValueError("Duplicate pipeline {}".format(stage.name))
+        if stage.depends is None:
+            depends[stage.name] = [pipelines[i - 1].name] if i else []
+        else:
+            depends[stage.name] = list(stage.depends)
+    stages = {stage.name: stage for stage in pipelines}
+    for name in depends:
+        for dep in depends[name]:
+            if dep not in stages:
+                raise ValueError("Pipeline {} depends on unknown {}".format(
+                    name, dep))
+
+    keys = {}
+    outputs = {}
+
+    def ready(name):
+        return all(dep in outputs for dep in depends[name])
+
+    def inputs_of(name):
+        deps = depends[name]
+        if not deps:
+            return results
+        elif len(deps) == 1:
+            return outputs[deps[0]]
+        return {dep: outputs[dep] for dep in deps}
+
+    try:
+        input_key = stable_hash(benchmark.name, results)
+    except TypeError as e:
+        logger.warning("Not memoizing pipelines of {}: {}".format(
+            benchmark.name, e))
+        input_key = None
+        cache_dir = None
+    pending = list(stages)
+    running = {}
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor_class(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in [n for n in pending if ready(n)]:
+                pending.remove(name)
+                stage = stages[name]
+                # A stage's key covers its own identity and, transitively,
+                # the identity of every stage upstream of it
+                keys[name] = stable_hash(
+                    _identity(stage),
+                    [keys[dep] for dep in depends[name]] or [input_key])
+                filename = os.path.join(
+                    cache_dir, "{}.pickle".format(keys[name])) \
+                    if cache_dir and stage.memoize else None
+                if filename:
+                    hit, output = _load(filename)
+                    if hit:
+                        logger.info("Reusing memoized pipeline {}".format(
+                            name))
+                        outputs[name] = output
+                        continue
+                future = executor.submit(
+                    _process, stage, benchmark, inputs_of(name))
+                running[future] = (name, filename)
+            if not running:
+                if pending and not any(ready(n) for n in pending):
+                    raise ValueError("Pipelines {} form a cycle".format(
+                        pending))
+                # memoized outputs made more stages ready
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, filename = running.pop(future)
+                outputs[name] = future.result()
+                if filename:
+                    _store(filename, outputs[name])
+    return outputs
+
+
+class Export(Pipeline):
+    """Write the results flowing through the pipeline to
+    `outdir/<benchmark>.<fmt>`, one row per metric, and pass them on
+    unchanged.
+
+    Parsed results don't carry invocation numbers, so rows record the
+    position of a result among those of its configuration and driver args
+    in the index column, and leave invocation empty.
+    """
+
+    def __init__(self, name, outdir, fmt="csv", chunk_size=10000,
+                 depends=None):
+        super().__init__(name, depends=depends, memoize=False)
+        self.outdir = outdir
+        self.fmt = fmt
+        self.chunk_size = chunk_size
+
+    def process(self, benchmark, results):
+        super().process(benchmark, results)
+        mkdirp(self.outdir)
+        filename = os.path.join(
+            self.outdir, "{}.{}".format(benchmark.name, self.fmt))
+        with exporter(self.fmt, filename, self.chunk_size) as e:
+            for config in results:
+                for driver_args in results[config]:
+                    for index, stats in enumerate(
+                            results[config][driver_args]):
+                        e.write(metric_rows(
+                            stats,
+                            benchmark=benchmark.name,
+                            configuration=config,
+                            driver_args=driver_args,
+                            index=index
+                        ))
+        return results
+
+
+class FlameGraph(Pipeline):
+    """Merge the collapsed stacks of the profiled jobs of each configuration
+    into `outdir/<benchmark>.<configuration>.folded` (LOGDIR/flamegraph by
+    default), ready for flamegraph.pl or difffolded.pl, and pass the results
+    on unchanged. The stacks are read from logdir, which defaults to the
+    directory being analysed.
+    """
+
+    def __init__(self, name, outdir=None, depends=None, logdir=None):
+        super().__init__(name, depends=depends, memoize=False)
+        self.outdir = outdir
+        self.logdir = logdir
+
+    def bind_logdir(self, logdir):
+        if not self.logdir:
+            self.logdir = logdir
+
+    def process(self, benchmark, results):
+        super().process(benchmark, results)
+        driver = benchmark.driver
+        logdir = self.logdir
+        config_descrs = [c.descr for c in driver.configurations]
+        outdir = self.outdir if self.outdir else os.path.join(
+            logdir, "flamegraph")
+        stacks = defaultdict(Counter)
+        for uuid, metadata, status in driver.read_manifest(logdir):
+            if metadata["benchmark"] != benchmark.name or \
+                    metadata["configuration"] not in config_descrs or \
+                    status.get("status", "ok") != "ok":
+                continue
+            stacks_filename = os.path.join(logdir, "{}.stacks".format(uuid))
+            if not os.path.exists(stacks_filename):
+                continue
+            with open(stacks_filename) as stacks_file:
+                for line in stacks_file:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    if stack and count.isdigit():
+                        stacks[metadata["configuration"]][stack] += int(count)
+        mkdirp(outdir)
+        for config in stacks:
+            filename = os.path.join(outdir, "{}.{}.folded".format(
+                benchmark.name, config.replace(os.sep, "_")))
+            with open(filename, "w") as folded_file:
+                for stack, count in sorted(stacks[config].items()):
+                    folded_file.write("{} {}\n".format(stack, count))
+            logger.info("Wrote {}".format(filename))
+        return results
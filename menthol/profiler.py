@@ -0,0 +1,66 @@
+import os
+import shlex
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler(object):
+    """A sampling profiler that a BashJob can wrap its commands with.
+
+    record is prepended to each command, and collapse is a shell command that
+    turns the raw profile into collapsed stacks ("frame;frame;frame count"
+    lines) on its stdout. Both are formatted with {raw}, the file the raw
+    profile goes to, and {cmd}, the name of the profiled command, already
+    quoted for the shell.
+    """
+
+    def __init__(self, name, record, collapse):
+        self.name = name
+        self.record = record
+        self.collapse = collapse
+
+    def wrap(self, cmd, raw):
+        fmt = {
+            "raw": shlex.quote(raw),
+            "cmd": shlex.quote(os.path.basename(cmd[0]) if cmd else "")
+        }
+        return [arg.format(**fmt) for arg in self.record] + list(cmd), \
+            self.collapse.format(**fmt)
+
+
+PROFILERS = {
+    "perf": Profiler(
+        "perf",
+        ["perf", "record", "-F", "99", "-g", "-o", "{raw}", "--"],
+        "perf script -i {raw} | stackcollapse-perf.pl"),
+    "py-spy": Profiler(
+        "py-spy",
+        ["py-spy", "record", "--format", "raw", "-o", "{raw}", "--"],
+        "cat {raw}"),
+    # records nothing, handy to check the plumbing without a profiler
+    "stub": Profiler(
+        "stub",
+        [],
+        "echo menthol-stub\\;{cmd} 1")
+}
+
+
+def parse_profile_spec(spec):
+    """Parse a profile spec of the form "sample:RATE" into the fraction of
+    invocations to profile.
+    """
+    kind, _, rate = spec.partition(":")
+    if kind != "sample":
+        raise ValueError("Unknown profile spec {}".format(spec))
+    rate = float(rate)
+    if not 0 <= rate <= 1:
+        raise ValueError("Sampling rate must be between 0 and 1")
+    return rate
+
+
+def sampled(invocation, rate):
+    """Whether to profile invocation, picking evenly spread invocations so
+    that a `rate` fraction of them are profiled.
+    """
+    return int((invocation + 1) * rate) > int(invocation * rate)
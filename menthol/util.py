@@ -5,6 +5,8 @@ import importlib.util
 import inspect
 import os
 import pathlib
+import hashlib
+import pickle
 from collections import defaultdict
 
 logger = logging.getLogger(__name__)
@@ -25,6 +27,8 @@ def subprocess_run(*args, **kwargs):
 def import_by_path(module_name, file_path):
     spec = importlib.util.spec_from_file_location(module_name, file_path)
     module = importlib.util.module_from_spec(spec)
+    # so that pickle can find the classes defined in the module
+    sys.modules[module_name] = module
     spec.loader.exec_module(module)
     return module
 
@@ -80,3 +84,62 @@ def frozen_dict(d):
 
 def mkdirp(path):
     pathlib.Path(path).mkdir(parents=True, exist_ok=True)
+
+
+def _canonical(obj):
+    if isinstance(obj, dict):
+        return "{" + ",".join(sorted(
+            "{}:{}".format(_canonical(k), _canonical(v))
+            for k, v in obj.items())) + "}"
+    elif isinstance(obj, (set, frozenset)):
+        return "set(" + ",".join(sorted(_canonical(x) for x in obj)) + ")"
+    elif isinstance(obj, (list, tuple)):
+        return "[" + ",".join(_canonical(x) for x in obj) + "]"
+    elif obj is None or isinstance(obj, (str, bytes, bool, int, float)):
+        # exact for these types, unlike the repr of e.g. large arrays
+        return repr(obj)
+    try:
+        pickled = pickle.dumps(obj, protocol=4)
+    except Exception as e:
+        raise TypeError("Cannot hash {!r}: {}".format(type(obj), e))
+    return "pickle:" + hashlib.sha256(pickled).hexdigest()
+
+
+def stable_hash(*objs):
+    """A hash of objs that, unlike hash(), is stable across processes: dicts
+    and sets are hashed independent of their iteration order, and other
+    objects by their pickled bytes. Raises TypeError for objects that can't
+    be pickled.
+    """
+    return hashlib.sha256(_canonical(objs).encode("utf-8")).hexdigest()
+
+
+VCS_DIRS = {".git", ".hg", ".svn"}
+
+
+def hash_tree(path, exclude=()):
+    """Hash the names and contents of every file under path (or of path
+    itself, if it is a file), skipping the files and directories in exclude
+    and version control directories.
+    """
+    h = hashlib.sha256()
+    exclude = {os.path.abspath(p) for p in exclude}
+    if os.path.isfile(path):
+        files = [path]
+    else:
+        files = []
+        for root, dirs, filenames in os.walk(path):
+            dirs[:] = sorted(
+                d for d in dirs if d not in VCS_DIRS and
+                os.path.abspath(os.path.join(root, d)) not in exclude)
+            files.extend(
+                os.path.join(root, f) for f in sorted(filenames)
+                if os.path.abspath(os.path.join(root, f)) not in exclude)
+    for filename in files:
+        h.update(os.path.relpath(filename, path).encode("utf-8"))
+        h.update(b"\0")
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
@@ -42,5 +42,7 @@ setup(
     },
 
     install_requires=REQUIRED,
-    extras_require={},
+    extras_require={
+        "parquet": ["pyarrow"]
+    },
 )
@@ -0,0 +1,121 @@
+import os
+
+from menthol import Benchmark, Configuration, Driver
+from menthol.cache import ArtifactCache
+
+
+class Fib(Benchmark):
+    def __init__(self, src, out):
+        super().__init__("fib")
+        self.src = src
+        self.out = out
+        self.builds = 0
+
+    def build(self, configuration):
+        self.builds += 1
+        with open(os.path.join(self.src, "fib.c")) as src:
+            with open(self.out, "w") as f:
+                f.write(src.read())
+
+    def artifacts(self, configuration):
+        return [self.out]
+
+    def source_tree(self, configuration):
+        return self.src
+
+
+def test_artifact_cache_roundtrip(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join("cache")))
+    artifact = tmpdir.join("a.out")
+    artifact.write("foo")
+    key = cache.key("fib", {"opt": 2}, "deadbeef")
+    assert not cache.fetch(key, [str(artifact)])
+    cache.store(key, [str(artifact)])
+    artifact.remove()
+    assert cache.fetch(key, [str(artifact)])
+    assert artifact.read() == "foo"
+
+
+def test_artifact_cache_eviction(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join("cache")), max_size=10)
+    artifact = tmpdir.join("a.out")
+    artifact.write("x" * 6)
+    cache.store("aa", [str(artifact)])
+    os.utime(cache.entry("aa"), (0, 0))
+    cache.store("bb", [str(artifact)])
+    assert not os.path.exists(cache.entry("aa"))
+    assert os.path.exists(cache.entry("bb"))
+
+
+def test_driver_build_cached(tmpdir):
+    src = tmpdir.mkdir("src")
+    src.join("fib.c").write("int main() {}")
+    bm = Fib(str(src), str(tmpdir.join("fib")))
+    d = Driver(str(tmpdir))
+    d.add_benchmark(bm)
+    d.add_configuration(Configuration("O2").update_args({"opt": 2}))
+    d.set_artifact_cache(ArtifactCache(str(tmpdir.join("cache"))))
+    d.build()
+    d.build()
+    assert bm.builds == 1
+    src.join("fib.c").write("int main() { return 1; }")
+    d.build()
+    assert bm.builds == 2
+    # rebuilding in place didn't corrupt the cached artifact
+    os.remove(str(tmpdir.join("fib")))
+    src.join("fib.c").write("int main() {}")
+    d.build()
+    assert bm.builds == 2
+    assert tmpdir.join("fib").read() == "int main() {}"
+
+
+def test_artifact_cache_fetch_failure(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join("cache")))
+    a = tmpdir.join("a.out")
+    b = tmpdir.join("b.out")
+    a.write("foo")
+    b.write("bar")
+    cache.store("aa", [str(a), str(b)])
+    # the second artifact vanished, e.g. evicted by another host mid-fetch
+    os.remove(os.path.join(cache.entry("aa"), "1"))
+    assert not cache.fetch("aa", [str(a), str(b)])
+    assert not a.exists()
+    assert not b.exists()
+
+
+def test_driver_build_artifact_in_source_tree(tmpdir):
+    src = tmpdir.mkdir("src")
+    src.join("fib.c").write("int main() {}")
+    src.mkdir(".git").join("HEAD").write("ref: refs/heads/master")
+    bm = Fib(str(src), str(src.join("build", "fib")))
+    src.mkdir("build")
+    d = Driver(str(tmpdir))
+    d.add_benchmark(bm)
+    d.add_configuration(Configuration("O2").update_args({"opt": 2}))
+    d.set_artifact_cache(ArtifactCache(str(tmpdir.join("cache"))))
+    for _ in range(3):
+        d.build()
+    assert bm.builds == 1
+    src.join(".git", "HEAD").write("ref: refs/heads/other")
+    d.build()
+    assert bm.builds == 1
+
+
+def test_driver_build_hashes_tree_once(tmpdir, monkeypatch):
+    import menthol.driver
+    hashed = []
+    hash_tree = menthol.driver.hash_tree
+    monkeypatch.setattr(menthol.driver, "hash_tree",
+                        lambda *args, **kwargs: hashed.append(args) or
+                        hash_tree(*args, **kwargs))
+    src = tmpdir.mkdir("src")
+    src.join("fib.c").write("int main() {}")
+    bm = Fib(str(src), str(tmpdir.join("fib")))
+    d = Driver(str(tmpdir))
+    d.add_benchmark(bm)
+    d.add_configuration(Configuration("O2").update_args({"opt": 2}))
+    d.add_configuration(Configuration("O3").update_args({"opt": 3}))
+    d.set_artifact_cache(ArtifactCache(str(tmpdir.join("cache"))))
+    d.build()
+    assert bm.builds == 2
+    assert len(hashed) == 1
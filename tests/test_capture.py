@@ -0,0 +1,66 @@
+import pytest
+
+from menthol.capture import OutputCapture, run_captured, open_log
+
+
+def test_capture_unlimited(tmpdir):
+    filename = str(tmpdir.join("a.o"))
+    with OutputCapture(filename) as c:
+        c.write(b"foo\n")
+        c.write(b"bar\n")
+    with open_log(filename) as f:
+        assert f.read() == "foo\nbar\n"
+
+
+def test_capture_head_tail(tmpdir):
+    filename = str(tmpdir.join("a.o"))
+    with OutputCapture(filename, limit=8, head=4) as c:
+        for i in range(10):
+            c.write("{}{}".format(i, i).encode("utf-8"))
+    assert c.truncated == 12
+    with open_log(filename) as f:
+        lines = f.read().split("\n")
+    assert lines[0] == "0011"
+    assert lines[1] == "[menthol: 12 bytes truncated]"
+    assert lines[2] == "8899"
+
+
+def test_capture_compress(tmpdir):
+    filename = str(tmpdir.join("a.o"))
+    with OutputCapture(filename, compress=True) as c:
+        c.write(b"foo\nbar\n")
+    assert not tmpdir.join("a.o").exists()
+    assert tmpdir.join("a.o.gz").exists()
+    with open_log(filename) as f:
+        assert list(f) == ["foo\n", "bar\n"]
+
+
+def test_run_captured(tmpdir):
+    stdout_filename = str(tmpdir.join("a.o"))
+    stderr_filename = str(tmpdir.join("a.e"))
+    with OutputCapture(stdout_filename) as stdout:
+        with OutputCapture(stderr_filename) as stderr:
+            returncode, rusage = run_captured(
+                ["bash", "-c", "echo out; echo err >&2; exit 3"],
+                stdout=stdout, stderr=stderr)
+    assert returncode == 3
+    assert rusage.ru_maxrss > 0
+    with open_log(stdout_filename) as f:
+        assert f.read() == "out\n"
+    with open_log(stderr_filename) as f:
+        assert f.read() == "err\n"
+
+
+class FullDisk(OutputCapture):
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+
+def test_run_captured_sink_error(tmpdir):
+    with FullDisk(str(tmpdir.join("a.o"))) as stdout:
+        with OutputCapture(str(tmpdir.join("a.e"))) as stderr:
+            # more than a pipe buffer, so the child would block if the pipe
+            # stopped being drained
+            with pytest.raises(OSError):
+                run_captured(["head", "-c", "1000000", "/dev/zero"],
+                             stdout=stdout, stderr=stderr)
@@ -0,0 +1,53 @@
+import csv
+
+import pytest
+
+from menthol.export import CSVExporter, ParquetExporter, metric_rows
+
+
+def test_metric_rows():
+    rows = list(metric_rows({"time": 42, "name": "foo"},
+                            benchmark="fib",
+                            driver_args=frozenset([("heap", 2)])))
+    assert len(rows) == 1
+    assert rows[0]["metric"] == "time"
+    assert rows[0]["value"] == 42.0
+    assert rows[0]["driver_args"] == '{"heap": 2}'
+    assert rows[0]["uuid"] is None
+
+
+def test_metric_rows_scalar():
+    rows = list(metric_rows(1.5, benchmark="fib"))
+    assert [(r["metric"], r["value"]) for r in rows] == [("value", 1.5)]
+
+
+def test_csv_exporter_chunks(tmpdir):
+    filename = str(tmpdir.join("results.csv"))
+    chunks = []
+    with CSVExporter(filename, chunk_size=2) as e:
+        write_chunk = e.write_chunk
+        e.write_chunk = lambda chunk: chunks.append(
+            [r["benchmark"] for r in chunk]) or write_chunk(chunk)
+        for bm, i in [("a", 1), ("a", 2), ("a", 3), ("b", 4)]:
+            e.write(metric_rows(i, benchmark=bm))
+    assert chunks == [["a", "a"], ["a"], ["b"]]
+    with open(filename) as f:
+        rows = list(csv.DictReader(f))
+    assert [r["benchmark"] for r in rows] == ["a", "a", "a", "b"]
+    assert rows[-1]["value"] == "4.0"
+
+
+def test_parquet_exporter_row_groups(tmpdir):
+    pq = pytest.importorskip("pyarrow.parquet")
+    filename = str(tmpdir.join("results.parquet"))
+    with ParquetExporter(filename, chunk_size=2) as e:
+        for bm, i in [("a", 1), ("b", 2), ("b", 3), ("b", 4), ("c", 5)]:
+            e.write(metric_rows(i, benchmark=bm, invocation=i,
+                                profiled=False))
+    f = pq.ParquetFile(filename)
+    benchmarks = [
+        f.read_row_group(i).column("benchmark").to_pylist()
+        for i in range(f.num_row_groups)
+    ]
+    assert benchmarks == [["a"], ["b", "b"], ["b"], ["c"]]
+    assert f.read().column("value").to_pylist() == [1.0, 2.0, 3.0, 4.0, 5.0]
@@ -0,0 +1,87 @@
+import json
+import os
+
+from menthol.capture import OutputCapture
+from menthol.infrastructure import Standalone, Raijin
+from menthol.job import BashJob
+
+
+def make_job(cmd, invocation):
+    j = BashJob()
+    j.add_cmd(cmd)
+    j.set_metadata({
+        "benchmark": "fib",
+        "invocation": invocation,
+        "configuration": "default"
+    })
+    return j
+
+
+def read_status(basedir):
+    with basedir.join("MANIFEST").open() as manifest_file:
+        return [json.loads(line.rstrip("\n").split("\t")[4])
+                for line in manifest_file]
+
+
+def test_standalone_retry(tmpdir):
+    s = Standalone(basedir=str(tmpdir))
+    s.set_retry_policy(max_attempts=3)
+    # fails the first time, succeeds the second
+    flag = tmpdir.join("flag")
+    s.schedule([make_job(["test -e {0} || (touch {0}; false)".format(flag)],
+                         0)])
+    s.run()
+    status = read_status(tmpdir)
+    assert status[0]["status"] == "ok"
+    assert status[0]["attempts"] == 2
+
+
+def test_standalone_fail_fast(tmpdir):
+    s = Standalone(basedir=str(tmpdir))
+    s.set_retry_policy(max_attempts=2, fail_fast=2)
+    s.schedule([make_job(["false"], i) for i in range(4)])
+    s.run()
+    status = read_status(tmpdir)
+    assert [x["status"] for x in status] == \
+        ["failed", "failed", "skipped", "skipped"]
+    assert status[0]["returncode"] == 1
+    assert status[0]["attempts"] == 2
+
+
+def test_standalone_rusage_per_job(tmpdir):
+    s = Standalone(basedir=str(tmpdir))
+    s.schedule([
+        make_job(["python3", "-c", "'bytearray(100 << 20)'"], 0),
+        make_job(["true"], 1)
+    ])
+    s.run()
+    big, small = read_status(tmpdir)
+    # maxrss is in KiB
+    assert big["maxrss"] > 100 << 10
+    assert small["maxrss"] < 50 << 10
+
+
+def test_raijin_retry_policy_warns(caplog):
+    r = Raijin(basedir="unused")
+    r.set_retry_policy(max_attempts=3)
+    assert "does not support retry policies" in caplog.text
+    assert not hasattr(r, "max_attempts")
+
+
+class FullDisk(OutputCapture):
+    def write(self, data):
+        raise OSError(28, "No space left on device")
+
+
+class FullDiskStandalone(Standalone):
+    def capture(self, job, filename):
+        return FullDisk(os.path.join(self.basedir, filename))
+
+
+def test_standalone_capture_error(tmpdir):
+    s = FullDiskStandalone(basedir=str(tmpdir))
+    s.schedule([make_job(["head -c 1000000 /dev/zero"], 0)])
+    s.run()
+    status = read_status(tmpdir)
+    assert status[0]["status"] == "failed"
+    assert "No space left" in status[0]["error"]
@@ -1,3 +1,5 @@
+import subprocess
+
 from menthol import Job
 from menthol.job import BashJob, PBSJob
 
@@ -55,3 +57,11 @@ def test_pbs_job():
     assert "#PBS -l ncpus=16" in script
     assert "export LD_LIBRARY_PATH=/opt/lib:$LD_LIBRARY_PATH" in script
     assert script[-1] == "RUST_TRACE=DEBUG ./a.out"
+
+
+def test_bash_job_returncode():
+    j = BashJob()
+    j.add_cmd(["exit", "3"])
+    assert j.run(stdout=subprocess.DEVNULL) == 3
+    assert j.returncode == 3
+    assert j.finished
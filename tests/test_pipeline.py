@@ -0,0 +1,168 @@
+import os
+
+import pytest
+
+from menthol import Benchmark, Pipeline
+from menthol.pipeline import run_pipelines
+from menthol.util import stable_hash, import_by_path
+
+
+class Add(Pipeline):
+    def __init__(self, name, n, calls, **kwargs):
+        super().__init__(name, **kwargs)
+        self.n = n
+        self._calls = calls
+
+    def process(self, benchmark, results):
+        self._calls.append(self.name)
+        if isinstance(results, dict):
+            return sum(results.values()) + self.n
+        return results + self.n
+
+
+def test_pipeline_linear():
+    calls = []
+    outputs = run_pipelines(Benchmark("fib"), [
+        Add("a", 1, calls),
+        Add("b", 10, calls)
+    ], 0)
+    assert outputs == {"a": 1, "b": 11}
+
+
+def test_pipeline_dag():
+    calls = []
+    outputs = run_pipelines(Benchmark("fib"), [
+        Add("aggregate", 1, calls),
+        Add("left", 10, calls, depends=["aggregate"]),
+        Add("right", 100, calls, depends=["aggregate"]),
+        Add("join", 1000, calls, depends=["left", "right"]),
+        Add("root", 5, calls, depends=[])
+    ], 0)
+    assert outputs == {
+        "aggregate": 1, "left": 11, "right": 101, "join": 1112, "root": 5}
+    assert calls.index("join") > calls.index("left")
+    assert calls.index("join") > calls.index("right")
+
+
+def test_pipeline_memoize(tmpdir):
+    cache_dir = str(tmpdir)
+    calls = []
+    bm = Benchmark("fib")
+
+    def stages(plot_n=2, **kwargs):
+        return [Add("stats", 1, calls, memoize=True),
+                Add("plot", plot_n, calls, memoize=True, **kwargs)]
+
+    run_pipelines(bm, stages(), 0, cache_dir)
+    assert calls == ["stats", "plot"]
+    run_pipelines(bm, stages(), 0, cache_dir)
+    assert calls == ["stats", "plot"]
+    # tweaking the plot doesn't rerun the stats
+    run_pipelines(bm, stages(plot_n=3), 0, cache_dir)
+    assert calls == ["stats", "plot", "plot"]
+    run_pipelines(bm, stages(plot_n=3, version=1), 0, cache_dir)
+    assert calls == ["stats", "plot", "plot", "plot"]
+    # but new inputs do
+    run_pipelines(bm, stages(), 1, cache_dir)
+    assert calls == ["stats", "plot", "plot", "plot", "stats", "plot"]
+
+
+def test_pipeline_memoize_opt_in(tmpdir):
+    calls = []
+    bm = Benchmark("fib")
+    run_pipelines(bm, [Add("plot", 1, calls)], 0, str(tmpdir))
+    run_pipelines(bm, [Add("plot", 1, calls)], 0, str(tmpdir))
+    assert calls == ["plot", "plot"]
+
+
+def test_pipeline_errors():
+    with pytest.raises(ValueError):
+        run_pipelines(Benchmark("fib"), [
+            Add("a", 1, [], depends=["b"]),
+            Add("b", 1, [], depends=["a"])
+        ], 0)
+    with pytest.raises(ValueError):
+        run_pipelines(Benchmark("fib"), [
+            Add("a", 1, [], depends=["c"])
+        ], 0)
+
+
+def test_stable_hash():
+    assert stable_hash({"a": 1, "b": frozenset([1, 2])}) == \
+        stable_hash({"b": frozenset([2, 1]), "a": 1})
+    assert stable_hash([1, 2]) != stable_hash([2, 1])
+
+
+class Opaque(object):
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return "Opaque(...)"
+
+
+def test_stable_hash_ignores_repr():
+    assert stable_hash(Opaque(1)) != stable_hash(Opaque(2))
+    assert stable_hash(Opaque(1)) == stable_hash(Opaque(1))
+    with pytest.raises(TypeError):
+        stable_hash(lambda: None)
+
+
+class Pid(Pipeline):
+    def process(self, benchmark, results):
+        return os.getpid()
+
+
+def test_pipeline_processes():
+    outputs = run_pipelines(Benchmark("fib"), [
+        Pid("left", depends=[]),
+        Pid("right", depends=[])
+    ], 0, processes=True)
+    assert os.getpid() not in outputs.values()
+
+
+DRIVER = '''
+from menthol import Benchmark, Configuration, Driver, Pipeline
+from menthol.infrastructure import Standalone
+
+
+class Fib(Benchmark):
+    def realize_job(self, job, configuration, invocation):
+        super().realize_job(job, configuration, invocation)
+        job.set_metadata({"driver_args": {}})
+        job.add_cmd(["echo", str(invocation)])
+
+    def parse(self, stdout, stderr):
+        return int(stdout)
+
+
+class Sum(Pipeline):
+    def process(self, benchmark, results):
+        total = sum(x for r in results.values() for v in r.values()
+                    for x in v)
+        with open(self.path, "w") as f:
+            f.write(str(total))
+
+
+class FibDriver(Driver):
+    def __init__(self, basedir):
+        super().__init__(basedir,
+                         infrastructure=Standalone(basedir=basedir))
+        bm = Fib("fib")
+        bm.pipelines = [Sum("sum")]
+        self.add_benchmark(bm)
+        self.add_configuration(
+            Configuration("default").set_description("default"))
+'''
+
+
+def test_analyse_processes_from_driver_file(tmpdir):
+    driver_file = tmpdir.join("drv.py")
+    driver_file.write(DRIVER)
+    mod = import_by_path("custom_driver_test", str(driver_file))
+    d = mod.FibDriver(str(tmpdir))
+    d.benchmarks[0].pipelines[0].path = str(tmpdir.join("sum"))
+    d.set_invocation(4)
+    d.start()
+    d.analyse(str(tmpdir), memoize=False, processes=True)
+    assert tmpdir.join("sum").read() == "6"
@@ -0,0 +1,98 @@
+import subprocess
+
+import pytest
+
+from menthol import Benchmark, Configuration, Driver, Pipeline
+from menthol.infrastructure import Standalone
+from menthol.job import BashJob
+from menthol.pipeline import FlameGraph
+from menthol.profiler import PROFILERS, parse_profile_spec, sampled
+
+
+def test_sampled():
+    assert sum(sampled(i, 0.1) for i in range(100)) == 10
+    assert sum(sampled(i, 1) for i in range(20)) == 20
+    assert not any(sampled(i, 0) for i in range(20))
+
+
+def test_parse_profile_spec():
+    assert parse_profile_spec("sample:0.25") == 0.25
+    with pytest.raises(ValueError):
+        parse_profile_spec("every:2")
+    with pytest.raises(ValueError):
+        parse_profile_spec("sample:2")
+
+
+def test_bash_job_profiled(tmpdir):
+    stacks = tmpdir.join("a.stacks")
+    j = BashJob()
+    j.add_cmd(["/usr/bin/env", "true"])
+    j.add_cmd(["false"])
+    j.set_profiler(PROFILERS["stub"], str(stacks))
+    assert j.run(stdout=subprocess.DEVNULL) == 1
+    assert stacks.read() == "menthol-stub;env 1\nmenthol-stub;false 1\n"
+
+
+class Fib(Benchmark):
+    def realize_job(self, job, configuration, invocation):
+        super().realize_job(job, configuration, invocation)
+        job.set_metadata({"driver_args": {}})
+        job.add_cmd(["echo", str(invocation)])
+
+    def parse(self, stdout, stderr):
+        return int(stdout)
+
+
+class Count(Pipeline):
+    def process(self, benchmark, results):
+        return sum(len(v) for r in results.values() for v in r.values())
+
+
+def test_flamegraph(tmpdir):
+    d = Driver(str(tmpdir), infrastructure=Standalone(basedir=str(tmpdir)))
+    bm = Fib("fib")
+    # after a stage that aggregates away the configurations
+    bm.pipelines = [Count("count"), FlameGraph("flamegraph")]
+    d.add_benchmark(bm)
+    d.add_configuration(Configuration("default").set_description("default"))
+    d.set_invocation(4)
+    d.set_profiler(PROFILERS["stub"], 0.5)
+    d.start()
+    d.analyse(str(tmpdir))
+    folded = tmpdir.join("flamegraph", "fib.default.folded")
+    assert folded.read() == "menthol-stub;echo 2\n"
+
+
+class Collect(Pipeline):
+    def process(self, benchmark, results):
+        self.results = results
+        return results
+
+
+def test_profiled_excluded(tmpdir):
+    d = Driver(str(tmpdir), infrastructure=Standalone(basedir=str(tmpdir)))
+    bm = Fib("fib")
+    collect = Collect("collect", memoize=False)
+    bm.pipelines = [collect]
+    d.add_benchmark(bm)
+    d.add_configuration(Configuration("default").set_description("default"))
+    d.set_invocation(4)
+    # profiles invocation 1 and 3
+    d.set_profiler(PROFILERS["stub"], 0.5)
+    d.start()
+    d.analyse(str(tmpdir))
+    assert list(collect.results["default"].values()) == [[0, 2]]
+    d.analyse(str(tmpdir), include_profiled=True)
+    assert list(collect.results["default"].values()) == [[0, 1, 2, 3]]
+
+
+def test_bash_job_profiled_path_with_space(tmpdir):
+    bystander = tmpdir.mkdir("my")
+    bystander.join("keep").write("")
+    stacks = tmpdir.mkdir("my bench").join("a.stacks")
+    j = BashJob()
+    j.add_cmd(["true"])
+    j.set_profiler(PROFILERS["stub"], str(stacks))
+    assert j.run(stdout=subprocess.DEVNULL) == 0
+    assert stacks.read() == "menthol-stub;true 1\n"
+    assert bystander.join("keep").exists()